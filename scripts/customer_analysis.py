@@ -6,27 +6,26 @@ import numpy as np
 def analyze_customers(df):
     """Analyze customer behavior and value"""
     # Customer summary metrics
+    # Last_InvoiceDate folded into the same agg — a separate groupby
+    # plus merge for recency would hash and scatter the frame twice
     customer_summary = df.groupby("CustomerID",observed=False).agg(
         Total_Purchases=("InvoiceNo", "nunique"),
         Total_Net_Revenue=("Net_Revenue", "sum"),
         Total_Sale_Qty=("Sale_Qty", "sum"),
-        Total_Return_Qty=("Return_Qty", "sum")
+        Total_Return_Qty=("Return_Qty", "sum"),
+        Last_InvoiceDate=("InvoiceDate", "max")
     ).reset_index()
-    
+
     # Calculate additional metrics
     customer_summary["Avg_Order_Value"] = (
         customer_summary["Total_Net_Revenue"] / customer_summary["Total_Purchases"]
     )
-    
+
     # Calculate recency
     latest_date = df['InvoiceDate'].max()
-    customer_recency = df.groupby('CustomerID',observed=False)['InvoiceDate'].max().reset_index()
-    customer_recency['RecencyDays'] = (latest_date - customer_recency['InvoiceDate']).dt.days
-    customer_summary = customer_summary.merge(
-        customer_recency[['CustomerID', 'RecencyDays']], 
-        on='CustomerID'
-    )
-    
+    customer_summary['RecencyDays'] = (latest_date - customer_summary['Last_InvoiceDate']).dt.days
+    customer_summary = customer_summary.drop(columns='Last_InvoiceDate')
+
     # Calculate return rate
     customer_summary['Return_Rate'] = (
         customer_summary['Total_Return_Qty'] /
@@ -1,15 +1,20 @@
 # utils.py
 import os
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 
 def save_results(df, customer_summary, output_dir="output"):
     """Save processed data to files"""
     os.makedirs(output_dir, exist_ok=True)
-    
-    # Save cleaned data
-    df.to_csv(f"{output_dir}/cleaned_retail_data.csv", index=False)
-    
-    # Save customer summary
-    customer_summary.to_csv(f"{output_dir}/customer_summary.csv",index=False)
-    
+
+    # Arrow's multithreaded C++ CSV writer replaces pandas' to_csv for
+    # the big cleaned frame; a parquet sibling is written from the same
+    # Table so downstream ingest can skip CSV parsing entirely
+    for frame, name in ((df, "cleaned_retail_data"), (customer_summary, "customer_summary")):
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        pacsv.write_csv(table, f"{output_dir}/{name}.csv")
+        pq.write_table(table, f"{output_dir}/{name}.parquet")
+
     print(f"\nResults saved to {output_dir}/ directory")